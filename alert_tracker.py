@@ -0,0 +1,87 @@
+"""
+Bookkeeping of weather alerts already broadcast to the mesh.
+
+The NWS active-alerts feed lists every alert until it expires, so each poll
+returns the same features again. Alerts are remembered by id together with
+their 'sent' timestamp; an alert is broadcast again only if NWS issues an
+updated version of it. Alerts past their 'expires' time are never broadcast,
+even if the feed still lists them. Entries are forgotten once the alert has
+expired and is no longer in the feed.
+"""
+
+import time
+from datetime import datetime
+
+# Seconds to remember alerts without a parseable 'expires' timestamp
+DEFAULT_RETENTION = 24 * 60 * 60
+
+# alert id -> (sent version, expires epoch)
+_sent_alerts: dict[str, tuple[str, float]] = {}
+
+
+def _alert_id(alert: dict) -> str:
+    return alert.get('id') or alert.get('properties', {}).get('id', '')
+
+
+def _parse_expires(properties: dict) -> float | None:
+    try:
+        return datetime.fromisoformat(properties['expires']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _expires_epoch(properties: dict) -> float:
+    expires = _parse_expires(properties)
+    return expires if expires is not None else time.time() + DEFAULT_RETENTION
+
+
+def prune_expired(active_ids: set[str] = frozenset()):
+    """
+    Function forgets alerts whose expiry time has passed.
+
+    Args:
+        active_ids (set[str], optional): Ids still listed in the feed, these are kept
+                so a late-listed alert isn't broadcast again. Defaults to an empty set.
+    """
+    now = time.time()
+    expired = [k for k, (_, expires) in _sent_alerts.items() if expires < now and k not in active_ids]
+    for alert_id in expired:
+        del _sent_alerts[alert_id]
+
+
+def unsent_alerts(alerts: list[dict]) -> list[dict]:
+    """
+    Function filters out expired alerts and alerts already broadcast in their current version.
+
+    Args:
+        alerts (list[dict]): List of GeoJSON alert features
+
+    Returns:
+        list[dict]: Unexpired alerts not broadcast yet, or updated since the last broadcast
+    """
+    prune_expired({_alert_id(alert) for alert in alerts})
+    now = time.time()
+    new_alerts = []
+    for alert in alerts:
+        properties = alert.get('properties', {})
+        expires = _parse_expires(properties)
+        if expires is not None and expires < now:
+            continue
+        alert_id = _alert_id(alert)
+        sent = _sent_alerts.get(alert_id)
+        if not alert_id or sent is None or sent[0] != properties.get('sent'):
+            new_alerts.append(alert)
+    return new_alerts
+
+
+def mark_sent(alert: dict):
+    """
+    Function records an alert as broadcast.
+
+    Args:
+        alert (dict): GeoJSON alert feature
+    """
+    alert_id = _alert_id(alert)
+    if alert_id:
+        properties = alert.get('properties', {})
+        _sent_alerts[alert_id] = (properties.get('sent'), _expires_epoch(properties))
@@ -0,0 +1,49 @@
+"""
+In-process memoization helpers.
+"""
+
+import functools
+import random
+import time
+
+
+def ttl_cache(ttl: float, jitter: float = 0.0):
+    """
+    Decorator memoizing function results for ttl seconds, keyed by positional arguments.
+
+    Expiry uses time.monotonic(), so wall clock changes (NTP, DST) don't
+    affect it. Expired entries are evicted when they are next looked up, and
+    at most once per ttl all expired entries are swept when a new one is stored,
+    so keys that are never looked up again don't accumulate. Exceptions raised
+    by the function are not cached. The decorated function gets a cache_clear() method.
+
+    Args:
+        ttl (float): Seconds a result stays cached
+        jitter (float, optional): +/- fraction applied randomly to ttl for each entry. Defaults to 0.0.
+    """
+    def decorator(func):
+        cache = {}
+        next_sweep = time.monotonic() + ttl
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            nonlocal next_sweep
+            now = time.monotonic()
+            entry = cache.get(args)
+            if entry is not None:
+                expires, value = entry
+                if now < expires:
+                    return value
+                del cache[args]
+            value = func(*args)
+            if now >= next_sweep:
+                for key in [k for k, (expires, _) in cache.items() if expires <= now]:
+                    del cache[key]
+                next_sweep = now + ttl
+            cache[args] = (now + ttl * random.uniform(1 - jitter, 1 + jitter), value)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -1,12 +1,48 @@
 import configparser
+import logging
+import random
 import time
-from typing import Any
+from dataclasses import dataclass, fields, replace
 import meshtastic.stream_interface
 import meshtastic.serial_interface
 import meshtastic.tcp_interface
 import serial.tools.list_ports
 import argparse
-import requests
+import nws_client
+import alert_tracker
+from message_processing import truncate_payload
+
+logger = logging.getLogger(__name__)
+
+# Retry policy for opening the node interface: exponential backoff capped at
+# MAX_CONNECT_DELAY seconds, with +/-20% jitter
+MAX_CONNECT_ATTEMPTS = 8
+MAX_CONNECT_DELAY = 60
+
+# USB (VID, PID) pairs of serial adapters found on common Meshtastic nodes
+MESHTASTIC_USB_IDS = {
+    (0x10c4, 0xea60),  # Silicon Labs CP210x
+    (0x1a86, 0x7523),  # WCH CH340
+    (0x1a86, 0x55d4),  # WCH CH9102
+    (0x303a, 0x1001),  # Espressif ESP32-S3 native USB
+    (0x239a, 0x8029),  # Adafruit nRF52 (RAK4631)
+}
+
+@dataclass(slots=True, frozen=True)
+class SystemConfig:
+    """System configuration merged from the config file and the CLI.
+
+    Attributes:
+        interface_type (str | None): Type of the node interface, 'serial' or 'tcp'
+        port (str | None): Serial port name for serial interface
+        hostname (str | None): Host name for TCP interface
+        location (str | None): State code for weather alerts
+    """
+    interface_type: str | None
+    port: str | None
+    hostname: str | None
+    location: str | None
+
 
 def init_cli_parser() -> argparse.Namespace:
     """Function builds the CLI parser and parses the arguments.
@@ -38,6 +74,7 @@ def init_cli_parser() -> argparse.Namespace:
     parser.add_argument(
         "--host", 
         action="store",
+        dest="hostname",
         help="TCP host address",
         default=None)
     
@@ -52,50 +89,34 @@ def init_cli_parser() -> argparse.Namespace:
     return args
 
 
-def merge_config(system_config: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
+def merge_config(system_config: SystemConfig, args: argparse.Namespace) -> SystemConfig:
     """Function merges configuration read from the config file and provided on the CLI.
     
     CLI arguments override values defined in the config file.
-    system_config argument is mutated by the function.
 
     Args:
-        system_config (dict[str, Any]): System config dict returned by initialize_config()
+        system_config (SystemConfig): System config returned by initialize_config()
         args (argparse.Namespace): argparse namespace with parsed CLI args
 
     Returns:
-        dict[str, Any]: system config dict with merged configurations
+        SystemConfig: New system config with merged configurations
     """
-    
-    if args.interface_type is not None:
-        system_config['interface_type'] = args.interface_type
-        
-    if args.port is not None:
-        system_config['port'] = args.port
-        
-    if args.host is not None:
-        system_config['host'] = args.host
-    
-    if args.location is not None:
-        system_config['location'] = args.location
-    
-    return system_config
+    names = {f.name for f in fields(SystemConfig)}
+    overrides = {k: v for k, v in vars(args).items() if v is not None and k in names}
+    return replace(system_config, **overrides)
 
 
-def initialize_config(config_file: str = None) -> dict[str, Any]:
+def initialize_config(config_file: str = None) -> SystemConfig:
     """
     Function reads and parses the system configuration file.
 
-    Returns a dict with the following entries:
-    config - parsed config file
-    interface_type - type of the active interface
-    hostname - host name for TCP interface
-    port - serial port name for serial interface
+    Values are read from the parser once, the ConfigParser instance itself is not kept.
 
     Args:
         config_file (str, optional): Path to config file. Function reads from './config.ini' if this arg is set to None. Defaults to None.
 
     Returns:
-        dict: dict with system configuration, as described above
+        SystemConfig: System configuration read from the file
     """
     config = configparser.ConfigParser()
 
@@ -105,22 +126,31 @@ def initialize_config(config_file: str = None) -> dict[str, Any]:
     try:
         config.read(config_file)
     except FileNotFoundError:
-        print(f"Configuration file {config_file} not found. Using default settings.")
+        logger.warning("Configuration file %s not found. Using default settings.", config_file)
+
+    return SystemConfig(
+        interface_type=config.get('interface', 'type', fallback=None),
+        port=config.get('interface', 'port', fallback=None),
+        hostname=config.get('interface', 'hostname', fallback=None),
+        location=config.get('weather', 'location', fallback=None))
 
-    interface_type = config['interface'].get('type', None)
-    hostname = config['interface'].get('hostname', None)
-    port = config['interface'].get('port', None)
 
-    return {
-        'config': config,
-        'interface_type': interface_type,
-        'hostname': hostname,
-        'port': port,
-        'location': config.get('weather', 'location', fallback=None)
-    }
+def find_serial_ports() -> list:
+    """
+    Function lists serial ports likely to belong to a Meshtastic node.
+
+    Ports are matched against known USB (VID, PID) pairs from MESHTASTIC_USB_IDS.
+    If none match, all serial ports in the system are returned.
+
+    Returns:
+        list: List of serial.tools.list_ports_common.ListPortInfo objects
+    """
+    all_ports = serial.tools.list_ports.comports()
+    ports = [p for p in all_ports if (p.vid, p.pid) in MESHTASTIC_USB_IDS]
+    return ports or list(all_ports)
 
 
-def get_interface(system_config: dict[str, Any]) -> meshtastic.stream_interface.StreamInterface:
+def get_interface(system_config: SystemConfig) -> meshtastic.stream_interface.StreamInterface:
     """
     Function opens and returns an instance of meshtastic interface of type specified by the configuration
     
@@ -130,25 +160,30 @@ def get_interface(system_config: dict[str, Any]) -> meshtastic.stream_interface.
     and for 'tcp' interface, an instance of meshtastic.tcp_interface.TCPInterface.
 
     Args:
-        system_config (dict[str, Any]): A dict with system configuration. See description of initialize_config() for details.
+        system_config (SystemConfig): System configuration, see initialize_config() and merge_config()
 
     Raises:
         ValueError: Exception raised in the following cases:
                 - Type of interface not provided in the system config
-                - Multiple serial ports present in the system, and no port specified in the configuration
+                - Multiple candidate serial ports present in the system, and no port specified in the configuration
                 - Serial port interface requested, but no ports found in the system
                 - Hostname not provided for TCP interface
+        OSError: Interface could not be opened after MAX_CONNECT_ATTEMPTS attempts,
+                e.g. serial port held by another process or TCP connection refused
 
     Returns:
         meshtastic.stream_interface.StreamInterface: An instance of StreamInterface
     """
-    while True:
+    ports = None
+    for attempt in range(MAX_CONNECT_ATTEMPTS):
         try:
-            if system_config['interface_type'] == 'serial':
-                if system_config['port']:
-                    return meshtastic.serial_interface.SerialInterface(system_config['port'])
-                else:
-                    ports = list(serial.tools.list_ports.comports())
+            match system_config.interface_type:
+                case 'serial':
+                    if system_config.port:
+                        return meshtastic.serial_interface.SerialInterface(system_config.port)
+                    # Enumerating ports walks sysfs, do it once and reuse on retries
+                    if ports is None:
+                        ports = find_serial_ports()
                     if len(ports) == 1:
                         return meshtastic.serial_interface.SerialInterface(ports[0].device)
                     elif len(ports) > 1:
@@ -156,69 +191,59 @@ def get_interface(system_config: dict[str, Any]) -> meshtastic.stream_interface.
                         raise ValueError(f"Multiple serial ports detected: {port_list}. Specify one with the 'port' argument.")
                     else:
                         raise ValueError("No serial ports detected.")
-            elif system_config['interface_type'] == 'tcp':
-                if not system_config['hostname']:
-                    raise ValueError("Hostname must be specified for TCP interface")
-                return meshtastic.tcp_interface.TCPInterface(hostname=system_config['hostname'])
-            else:
-                raise ValueError("Invalid interface type specified in config file")
-        except PermissionError as e:
-            print(f"PermissionError: {e}. Retrying in 5 seconds...")
-            time.sleep(5)
-
-
-def fetch_weather_alerts(location: str) -> dict:
-    """
-    Function fetches weather alerts from the National Weather Service API.
-
-    Args:
-        location (str): State code for which to fetch weather alerts
-
-    Returns:
-        dict: A dictionary containing weather alerts
-    """
-    url = f"https://api.weather.gov/alerts/active/area/{location}"
-    headers = {
-        'User-Agent': 'MeshtasticWeatherAlertSystem/1.0 (your_email@example.com)'
-    }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Failed to fetch weather alerts: {response.status_code}")
-        return {}
-
-
-def broadcast_weather_alerts(interface: meshtastic.stream_interface.StreamInterface, alerts: dict):
+                case 'tcp':
+                    if not system_config.hostname:
+                        raise ValueError("Hostname must be specified for TCP interface")
+                    return meshtastic.tcp_interface.TCPInterface(hostname=system_config.hostname)
+                case _:
+                    raise ValueError("Invalid interface type specified in config file")
+        except OSError as e:
+            # Covers PermissionError on a busy serial port and ConnectionRefusedError for TCP
+            if attempt == MAX_CONNECT_ATTEMPTS - 1:
+                raise
+            delay = min(MAX_CONNECT_DELAY, 2 ** attempt) * random.uniform(0.8, 1.2)
+            logger.warning("%s: %s. Retrying in %.1f seconds...", type(e).__name__, e, delay)
+            time.sleep(delay)
+
+
+def broadcast_weather_alerts(interface: meshtastic.stream_interface.StreamInterface, alerts: list[dict]):
     """
     Function broadcasts weather alerts over the Meshtastic network.
 
     Args:
         interface (meshtastic.stream_interface.StreamInterface): Meshtastic interface to use for broadcasting
-        alerts (dict): Dictionary containing weather alerts
+        alerts (list[dict]): List of alert features returned by nws_client.fetch_alerts()
     """
-    if 'features' in alerts and alerts['features']:
-        for feature in alerts['features']:
+    if alerts:
+        for feature in alert_tracker.unsent_alerts(alerts):
             properties = feature.get('properties', {})
             event = properties.get('event', 'Unknown Event')
             description = properties.get('description', 'No description available')
-            message = f"Weather Alert: {event} - {description}"
+            message = truncate_payload(f"Weather Alert: {event} - {description}")
             interface.sendText(message)
-            print(f"Broadcasting: {message}")
+            alert_tracker.mark_sent(feature)
+            logger.info("Broadcasting: %s", message)
     else:
-        print("No weather alerts to broadcast.")
+        logger.info("No weather alerts to broadcast.")
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     args = init_cli_parser()
     config = initialize_config(args.config)
     system_config = merge_config(config, args)
     interface = get_interface(system_config)
     
+    deadline = time.monotonic()
     while True:
-        alerts = fetch_weather_alerts(system_config['location'])
-        broadcast_weather_alerts(interface, alerts)
-        time.sleep(600)  # Check for new alerts every 10 minutes
+        try:
+            alerts = nws_client.fetch_alerts(system_config.location)
+            broadcast_weather_alerts(interface, alerts)
+        except Exception as e:
+            logger.error("Error in main loop: %s", e)
+        # Check for new alerts every 10 minutes, without catch-up polls after an overrun
+        deadline = max(deadline + 600, time.monotonic())
+        time.sleep(max(0, deadline - time.monotonic()))
 
 
 if __name__ == "__main__":
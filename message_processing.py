@@ -1,58 +1,68 @@
 import logging
-import requests
 import time
+import nws_client
+import alert_tracker
+from caching import ttl_cache
 from meshtastic import BROADCAST_NUM
 from meshtastic.stream_interface import StreamInterface
-from utils import send_message
 
-WEATHER_API_URL = "https://api.weather.gov/alerts/active/area/{STATE}"
+MAX_PAYLOAD_BYTES = 228  # Meshtastic text message payload limit
 
-def fetch_weather_alerts(state):
-    url = WEATHER_API_URL.format(STATE=state)
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json().get('features', [])
-    else:
-        logging.error(f"Failed to fetch weather alerts: {response.status_code} {response.text}")
-        return []
+ALERT_TEMPLATE = "🚨Weather Alert🚨\nHeadline: {headline}\nDescription: {description}\nInstruction: {instruction}"
 
-def format_alert_message(alert):
-    properties = alert.get('properties', {})
-    headline = properties.get('headline', 'No headline')
-    description = properties.get('description', 'No description')
-    instruction = properties.get('instruction', 'No instruction')
+class _AlertFields(dict):
+    """Alert properties mapping returning a placeholder for missing template fields."""
+    def __missing__(self, key):
+        return f"No {key}"
+
+def truncate_payload(message: str, limit: int = MAX_PAYLOAD_BYTES) -> str:
+    # Cut on the UTF-8 byte length, emoji take 3-4 bytes each
+    encoded = message.encode('utf-8')
+    if len(encoded) <= limit:
+        return message
+    return encoded[:limit].decode('utf-8', errors='ignore')
 
-    message = f"🚨Weather Alert🚨\nHeadline: {headline}\nDescription: {description}\nInstruction: {instruction}"
-    return message
+def format_alert_message(alert):
+    return ALERT_TEMPLATE.format_map(_AlertFields(alert.get('properties', {})))
 
 def broadcast_weather_alerts(interface: StreamInterface, state: str):
-    alerts = fetch_weather_alerts(state)
-    for alert in alerts:
-        message = format_alert_message(alert)
-        send_message(message, BROADCAST_NUM, interface)
+    alerts = nws_client.fetch_alerts(state)
+    for alert in alert_tracker.unsent_alerts(alerts):
+        message = truncate_payload(format_alert_message(alert))
+        interface.sendText(message, BROADCAST_NUM)
+        alert_tracker.mark_sent(alert)
 
-def on_receive(packet, interface):
+@ttl_cache(3600)
+def _lookup_short_name(node_id, interface):
+    # Raises KeyError for nodes without user info yet, so the miss isn't cached
+    return (interface.nodes or {})[node_id]['user']['shortName']
+
+def get_node_short_name(node_id, interface):
     try:
-        if 'decoded' in packet and packet['decoded']['portnum'] == 'TEXT_MESSAGE_APP':
-            message_bytes = packet['decoded']['payload']
-            message_string = message_bytes.decode('utf-8')
-            sender_id = packet['from']
-            sender_node_id = packet['fromId']
+        return _lookup_short_name(node_id, interface)
+    except (KeyError, TypeError):
+        return node_id
 
-            sender_short_name = get_node_short_name(sender_node_id, interface)
-            logging.info(f"Received message from '{sender_short_name}': {message_string}")
+def on_receive(packet, interface):
+    decoded = packet.get('decoded')
+    if not decoded or decoded.get('portnum') != 'TEXT_MESSAGE_APP':
+        return
 
-            # No special handling of received messages in this weather alert system.
-            # If needed, you could add specific commands for users to trigger weather alert broadcasts.
+    message_string = decoded.get('payload', b'').decode('utf-8', errors='replace')
+    sender_short_name = get_node_short_name(packet.get('fromId'), interface)
+    logging.info("Received message from '%s': %s", sender_short_name, message_string)
 
-    except KeyError as e:
-        logging.error(f"Error processing packet: {e}")
+    # No special handling of received messages in this weather alert system.
+    # If needed, you could add specific commands for users to trigger weather alert broadcasts.
 
 # Main loop to periodically fetch and broadcast weather alerts
 def main(interface: StreamInterface, state: str, interval: int = 300):
+    deadline = time.monotonic()
     while True:
         try:
             broadcast_weather_alerts(interface, state)
-            time.sleep(interval)
         except Exception as e:
-            logging.error(f"Error in main loop: {e}")
+            logging.error("Error in main loop: %s", e)
+        # Don't fire catch-up polls after a cycle overran the interval
+        deadline = max(deadline + interval, time.monotonic())
+        time.sleep(max(0, deadline - time.monotonic()))
@@ -0,0 +1,329 @@
+"""
+HTTP client for the National Weather Service API.
+
+All NWS requests go through one process-wide client returned by
+get_session(), so TCP/TLS connections are kept alive and reused between
+polls. When httpx (with the h2 extra) is installed the client is an
+httpx.Client speaking HTTP/2, otherwise a pooled requests.Session.
+
+Alert responses are cached per state. Within the cache TTL the cached
+features are returned without touching the network (see caching.ttl_cache);
+after that a conditional GET (If-None-Match / If-Modified-Since) is sent and a
+304 Not Modified response reuses the cached features without parsing.
+A 200 response repeating the last empty feed (same Content-Length and
+ETag) is not parsed either.
+
+Large alert responses are stream-parsed one feature at a time with ijson,
+smaller ones are parsed in one go with orjson. Both are optional and the
+code falls back to the stdlib json module. Either way only the
+alert properties listed in ALERT_PROPERTIES are kept.
+"""
+
+import contextlib
+import json
+import logging
+import time
+import requests
+import urllib3.exceptions
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from caching import ttl_cache
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NWS_ALERTS_URL = "https://api.weather.gov/alerts/active/area/{state}"
+USER_AGENT = "MeshtasticWeatherAlertSystem/1.0 (your_email@example.com)"
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (5, 15)
+
+# Retry policy shared by both clients: attempts after the first one,
+# exponential backoff factor in seconds, and response statuses to retry
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Connection pool limits of the HTTP/2 client
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 5
+
+# Seconds a cached alert response is considered fresh, and the +/- fraction
+# of jitter applied to it so restarted instances don't poll in lockstep.
+# Kept below the shortest polling interval (300 s) so scheduled polls always revalidate.
+ALERT_CACHE_TTL = 240
+ALERT_CACHE_JITTER = 0.1
+
+# Responses larger than this many bytes on the wire, or without a
+# Content-Length, are stream-parsed when ijson is available
+STREAM_PARSE_THRESHOLD = 256 * 1024
+
+# Alert properties used when formatting and tracking broadcasts
+ALERT_PROPERTIES = ('id', 'event', 'headline', 'description', 'instruction', 'sent', 'expires')
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter applying REQUEST_TIMEOUT to requests sent without an explicit timeout.
+
+    Timeouts left after retries are reported by fetch_alerts() as a failed fetch.
+    """
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = REQUEST_TIMEOUT
+        return super().send(request, **kwargs)
+
+
+# Errors raised by either client once retries are exhausted, including
+# urllib3 errors from reading the raw stream of a requests response
+_NETWORK_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError)
+if httpx is not None:
+    _NETWORK_ERRORS += (httpx.TransportError,)
+
+# Errors raised for malformed or truncated response bodies
+_DECODE_ERRORS = (ValueError,)
+if ijson is not None:
+    _DECODE_ERRORS += (ijson.JSONError,)
+
+logger = logging.getLogger(__name__)
+
+_HEADERS = {'User-Agent': USER_AGENT, 'Accept': 'application/geo+json'}
+
+_session = None
+
+# state -> (etag, last_modified, features), used for conditional GETs
+_alert_cache: dict[str, tuple[str, str, list]] = {}
+
+# state -> (content_length, etag) of the last response with no active alerts
+_empty_responses: dict[str, tuple[str, str]] = {}
+
+
+def _create_httpx_client():
+    connect_timeout, read_timeout = REQUEST_TIMEOUT
+    transport = httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS))
+    return httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        headers=_HEADERS)
+
+
+def _create_requests_session() -> requests.Session:
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False)
+    session = requests.Session()
+    session.headers.update(_HEADERS)
+    session.mount("https://", _TimeoutHTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retry))
+    return session
+
+
+def get_session():
+    """
+    Function returns the process-wide HTTP client, creating it on first use.
+
+    An httpx.Client with HTTP/2 is used when httpx and h2 are installed,
+    otherwise a requests.Session. Both apply REQUEST_TIMEOUT to every request,
+    and alert fetches retry connection errors, timeouts and RETRY_STATUSES
+    responses up to RETRY_TOTAL times with exponential backoff.
+
+    Returns:
+        httpx.Client | requests.Session: Shared HTTP client
+    """
+    global _session
+    if _session is None:
+        if httpx is not None:
+            try:
+                _session = _create_httpx_client()
+            except ImportError:
+                # httpx raises ImportError for http2=True when h2 is missing
+                _session = None
+        if _session is None:
+            _session = _create_requests_session()
+    return _session
+
+
+def close():
+    """
+    Function closes the shared client and its pooled connections.
+    """
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+def _stream(url: str, headers: dict):
+    session = get_session()
+    if isinstance(session, requests.Session):
+        # Retries are handled by the urllib3 Retry policy mounted on the session
+        return session.get(url, headers=headers, stream=True)
+    return _httpx_stream(session, url, headers)
+
+
+def _retry_delay(attempt: int, response=None) -> float:
+    delay = RETRY_BACKOFF_FACTOR * 2 ** attempt
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        delay = max(delay, int(retry_after))
+    return delay
+
+
+@contextlib.contextmanager
+def _httpx_stream(client, url: str, headers: dict):
+    # httpx only retries failed connects, so mirror the urllib3 Retry policy here
+    for attempt in range(RETRY_TOTAL + 1):
+        try:
+            response = client.send(client.build_request('GET', url, headers=headers), stream=True)
+        except httpx.TransportError as e:
+            # Covers connection errors and connect/read timeouts
+            if attempt == RETRY_TOTAL:
+                raise
+            delay = _retry_delay(attempt)
+            logger.warning("%s fetching %s. Retrying in %.1f seconds...", type(e).__name__, url, delay)
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                break
+            response.close()
+            delay = _retry_delay(attempt, response)
+            logger.warning("HTTP %s fetching %s. Retrying in %.1f seconds...", response.status_code, url, delay)
+        time.sleep(delay)
+
+    try:
+        yield response
+    finally:
+        response.close()
+
+
+class _ChunkReader:
+    """Minimal file-like object over an iterator of byte chunks, for ijson."""
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = b''
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _slim_feature(feature: dict) -> dict:
+    properties = feature.get('properties') or {}
+    return {
+        'id': feature.get('id'),
+        'properties': {k: properties[k] for k in ALERT_PROPERTIES if k in properties}
+    }
+
+
+def _read_body(response) -> bytes:
+    if isinstance(response, requests.Response):
+        return response.content
+    return response.read()
+
+
+def _parse_features(response) -> list[dict]:
+    content_length = int(response.headers.get('Content-Length') or 0)
+    if ijson is not None and (not content_length or content_length > STREAM_PARSE_THRESHOLD):
+        if isinstance(response, requests.Response):
+            # Let urllib3 undo gzip/deflate since ijson reads the raw stream
+            response.raw.decode_content = True
+            body = response.raw
+        else:
+            body = _ChunkReader(response.iter_bytes())
+        return [_slim_feature(f) for f in ijson.items(body, 'features.item')]
+
+    if orjson is not None:
+        document = orjson.loads(_read_body(response))
+    else:
+        document = json.loads(_read_body(response))
+    return [_slim_feature(f) for f in document.get('features', [])]
+
+
+class _FetchError(Exception):
+    """Raised for failed alert requests, so the failure isn't stored by ttl_cache."""
+
+
+def fetch_alerts(state: str) -> list[dict]:
+    """
+    Function fetches active weather alerts for a state from the NWS API.
+
+    Responses are cached per state, see the module docstring for details.
+    Failed requests are not cached, the next call tries again. Error statuses,
+    network errors and timeouts left after retries, and malformed responses
+    are logged and reported as an empty list.
+
+    Args:
+        state (str): State code for which to fetch weather alerts
+
+    Returns:
+        list[dict]: List of GeoJSON alert features, empty if the request failed
+    """
+    try:
+        return _fetch_alerts(state)
+    except _FetchError as e:
+        logger.error("Failed to fetch weather alerts: %s", e)
+        return []
+
+
+@ttl_cache(ALERT_CACHE_TTL, jitter=ALERT_CACHE_JITTER)
+def _fetch_alerts(state: str) -> list[dict]:
+    cached = _alert_cache.get(state)
+    headers = {}
+    if cached is not None:
+        etag, last_modified, features = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    try:
+        with _stream(NWS_ALERTS_URL.format(state=state), headers) as response:
+            if response.status_code == 304 and cached is not None:
+                return features
+
+            if response.status_code != 200:
+                raise _FetchError(f"{response.status_code} {_read_body(response).decode('utf-8', errors='replace')}")
+
+            etag = response.headers.get('ETag', '')
+            content_length = response.headers.get('Content-Length')
+            empty_key = (content_length, etag)
+            if content_length and etag and _empty_responses.get(state) == empty_key:
+                # Same empty feed as last time from a server ignoring conditional GETs.
+                # Drain the unparsed body so the connection goes back to the pool.
+                _read_body(response)
+                features = []
+            else:
+                features = _parse_features(response)
+                if features or not content_length:
+                    _empty_responses.pop(state, None)
+                else:
+                    _empty_responses[state] = empty_key
+    except _NETWORK_ERRORS as e:
+        raise _FetchError(f"{type(e).__name__}: {e}") from e
+    except _DECODE_ERRORS as e:
+        raise _FetchError(f"Invalid response: {e}") from e
+
+    _alert_cache[state] = (
+        etag,
+        response.headers.get('Last-Modified', ''),
+        features)
+    return features
@@ -10,53 +10,97 @@ This system fetches weather alerts from the National Weather Service and
 broadcasts them to a Meshtastic network.
 """
 
+import asyncio
 import logging
-import time
-import requests
+import nws_client
+import alert_tracker
+import message_processing
+from message_processing import truncate_payload
 from config_init import initialize_config, get_interface, init_cli_parser, merge_config
 from meshtastic import BROADCAST_NUM
+from pubsub import pub
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def fetch_weather_alerts(state: str):
-    url = f"https://api.weather.gov/alerts/active/area/{state}"
-    response = requests.get(url)
-    response.raise_for_status()
-    return response.json().get('features', [])
+POLL_INTERVAL = 600  # Check every 10 minutes
 
-def broadcast_alerts(alerts, interface):
-    for alert in alerts:
-        properties = alert['properties']
-        message = f"⚠️ Weather Alert: {properties['event']}\n{properties['headline']}\n{properties['description']}"
-        logging.info(f"Broadcasting message: {message}")
-        interface.sendText(message, BROADCAST_NUM)
+async def broadcast_alerts(alerts, interface):
+    alerts = alert_tracker.unsent_alerts(alerts)
+    messages = [
+        truncate_payload(f"⚠️ Weather Alert: {p['event']}\n{p['headline']}\n{p['description']}")
+        for p in (alert['properties'] for alert in alerts)
+    ]
+
+    loop = asyncio.get_running_loop()
+    for alert, message in zip(alerts, messages):
+        logging.info("Broadcasting message: %s", message)
+        await loop.run_in_executor(None, interface.sendText, message, BROADCAST_NUM)
+        alert_tracker.mark_sent(alert)
+
+async def poll_alerts(state: str, interface):
+    # Poll on a fixed monotonic schedule so the interval doesn't drift by the time spent working
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    while True:
+        try:
+            # The blocking HTTP client is kept off the event loop
+            alerts = await asyncio.to_thread(nws_client.fetch_alerts, state)
+            if alerts:
+                await broadcast_alerts(alerts, interface)
+            else:
+                logging.info("No active alerts at the moment.")
+        except Exception as e:
+            logging.error("Error while polling weather alerts: %s", e)
+        # Don't fire catch-up polls after a cycle overran the interval
+        deadline = max(deadline + POLL_INTERVAL, loop.time())
+        await asyncio.sleep(max(0, deadline - loop.time()))
+
+async def handle_packets(packets: asyncio.Queue, interface):
+    while True:
+        packet = await packets.get()
+        try:
+            message_processing.on_receive(packet, interface)
+        except Exception as e:
+            logging.error("Error processing packet: %s", e)
+
+async def run(state: str, interface):
+    loop = asyncio.get_running_loop()
+    packets = asyncio.Queue()
+
+    def on_packet(packet, interface):
+        # Called on the Meshtastic reader thread, hand the packet over to the event loop
+        loop.call_soon_threadsafe(packets.put_nowait, packet)
+
+    # pubsub only keeps a weak reference to on_packet, it stays alive with this frame
+    pub.subscribe(on_packet, "meshtastic.receive")
+    try:
+        await asyncio.gather(
+            asyncio.create_task(poll_alerts(state, interface)),
+            asyncio.create_task(handle_packets(packets, interface)))
+    finally:
+        pub.unsubscribe(on_packet, "meshtastic.receive")
 
 def main():
     args = init_cli_parser()
     config_file = args.config if args.config else None
     system_config = initialize_config(config_file)
-    merge_config(system_config, args)
+    system_config = merge_config(system_config, args)
 
     interface = get_interface(system_config)
-    state = system_config['state']
+    state = system_config.location
 
-    logging.info(f"Weather Alerts system running for state: {state} on {system_config['interface_type']} interface...")
+    logging.info("Weather Alerts system running for state: %s on %s interface...", state, system_config.interface_type)
 
     try:
-        while True:
-            alerts = fetch_weather_alerts(state)
-            if alerts:
-                broadcast_alerts(alerts, interface)
-            else:
-                logging.info("No active alerts at the moment.")
-            time.sleep(600)  # Check every 10 minutes
+        asyncio.run(run(state, interface))
     except KeyboardInterrupt:
         logging.info("Shutting down the Weather Alerts system...")
-        interface.close()
     except Exception as e:
-        logging.error(f"An error occurred: {e}")
+        logging.error("An error occurred: %s", e)
+    finally:
         interface.close()
+        nws_client.close()
 
 if __name__ == "__main__":
     main()